@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING, Optional, List
 
-from pyhanoi.libhanoi import Graph, Delta, TowerSet
+from pyhanoi.libhanoi import Graph, Node, Delta, TowerSet
 
 if TYPE_CHECKING:
     from pyhanoi.libhanoi import TowerSet
@@ -34,6 +34,16 @@ def make_node(towers: int, rings: int, full_tower: int = 0) -> TowerSet:
     
     return result
 
+def trace_log(node: Node) -> List[Delta]:
+    log: List[Delta] = []
+
+    while node.parent is not None:
+        log.append(node.parent_delta)
+        node = node.parent
+    log.reverse()
+
+    return log
+
 def print_log(log: List[Delta]):
     for block in log:
         init, final = block
@@ -52,14 +62,9 @@ if __name__ == "__main__":
     graph.process()
 
     if graph.found_nodes:
-        node = graph.found_nodes[0]
-        solutions = 0
-
-        for history in node.history:
-            n, log = history
-            if n.data == start_tower:
-                solutions += 1
-                print ("Solution:", solutions, "Steps:", len(log))
-                print (SMALL_DIVIDER)
-                print_log(log)
-                print (SMALL_DIVIDER)
+        log = trace_log(graph.found_nodes[0])
+
+        print ("Steps:", len(log))
+        print (SMALL_DIVIDER)
+        print_log(log)
+        print (SMALL_DIVIDER)
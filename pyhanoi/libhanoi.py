@@ -2,49 +2,216 @@
 
 from __future__ import annotations
 
-from itertools import permutations 
-from typing import List, Optional, Tuple, Any, Callable, NoReturn
-from copy import deepcopy, copy
-from enum import Enum, auto
+from typing import Deque, Dict, List, Set, Optional, Tuple, Any, Callable, NoReturn
+from collections import deque
+from functools import lru_cache
 
 class InvalidRingOrderError(Exception):
     pass
 
+class _FoundGoal(Exception):
+    """ Raised to end the search once every pinned state is found """
+
 TowerSet = List[List[int]]
-Connection = Tuple["Node", "Delta"]
-ConnectionPrototype = Tuple["TowerSet", "Delta"]
+ConnectionPrototype = Tuple[int, "Delta"]
 Delta = Tuple[int, int]
-History = Tuple["Node", List[Delta]]
+Expander = Callable[[List[int], int], List["ConnectionPrototype"]]
+Meeting = Tuple["Node", "Node"]
+
+def digit_bits(towers: int) -> int:
+    """ Bits needed to store one tower index """
+
+    return max(1, (towers - 1).bit_length())
+
+def make_key(data: TowerSet) -> int:
+    """ Packs a tower set into one int, with one digit_bits wide field
+    per ring (ring 1 lowest) holding the index of its tower """
+
+    bits = digit_bits(len(data))
+    key = 0
+    for index, tower in enumerate(data):
+        for ring in tower:
+            key |= index << (bits * (ring - 1))
+
+    return key
+
+def make_masks(data: TowerSet) -> List[int]:
+    """ Turns each tower into a bitmask of its rings (ring 1 is bit 0),
+    so the top ring of a tower is its lowest set bit """
+
+    return [sum(1 << (ring - 1) for ring in tower) for tower in data]
+
+def check_validity(data: TowerSet) -> bool:
+    for tower in data:
+        sorted_tower = sorted(tower, reverse=True)
+
+        if sorted_tower != tower:
+            return False
+    
+    return True
+
+def move_masks(masks: List[int], delta: Delta) -> List[int]:
+    init, final = delta
+    top = masks[init] & -masks[init]
+    result = masks[:]
+    result[init] ^= top
+    result[final] |= top
+
+    return result
+
+def expand(masks: List[int], key: int) -> List[ConnectionPrototype]:
+    """ Lists every legal move out of a state as (key, delta), leaving
+    the masks of the new state to be built only if it is not visited.
+    This is the reference version that make_expand output is checked
+    against; the search itself uses Graph._expand """
+
+    bits = digit_bits(len(masks))
+    tops = [mask & -mask for mask in masks]
+    n = len(tops)
+    result: List[ConnectionPrototype] = []
+
+    for init in range(n):
+        top = tops[init]
+        if not top:
+            continue
+
+        shift = bits * (top.bit_length() - 1)
+        for final in range(n):
+            if init == final or 0 < tops[final] < top:
+                continue
+
+            result.append((key + ((final - init) << shift), (init, final)))
+
+    return result
+
+@lru_cache(maxsize=None)
+def make_expand(towers: int) -> Expander:
+    """ Builds a version of expand for a fixed number of towers, with the
+    tower loops unrolled and digit_bits folded into the source """
+
+    bits = digit_bits(towers)
+    lines = [
+        "def expand(masks, key):",
+        "    " + ", ".join(f"m{i}" for i in range(towers)) + ", = masks",
+    ]
+    lines += [f"    t{i} = m{i} & -m{i}" for i in range(towers)]
+    lines.append("    result = []")
+
+    for init in range(towers):
+        lines.append(f"    if t{init}:")
+        lines.append(f"        shift = {bits} * (t{init}.bit_length() - 1)")
+        for final in range(towers):
+            if final == init:
+                continue
+            lines.append(f"        if not t{final} or t{final} > t{init}:")
+            lines.append(
+                f"            result.append((key + ({final - init} << shift), ({init}, {final})))"
+            )
+
+    lines.append("    return result")
+
+    namespace: Dict[str, Any] = {}
+    exec(compile("\n".join(lines), f"<expand_T{towers}>", "exec"), namespace)
+    return namespace["expand"]
 
 class Graph():
     """ Graph Class """
 
     def __init__(self, start: TowerSet, rings: int):
         self.pinned: List[TowerSet] = []
+        self.pinned_keys: Set[int] = set()
         self.found_nodes: List[Node] = []
         self.rings = rings
-        self.current_nodes: List[Node] = []
-        self.next_nodes: List[Node] = []
+        self.current_nodes: Deque[Node] = deque()
+        self.next_nodes: Deque[Node] = deque()
+        self.visited: Dict[int, Node] = {}
+        self._expand = make_expand(len(start))
 
         self.current_nodes.append(Node(start, self))
 
     def _check_pinned(self, node: Node):
-        for index, term in enumerate(self.pinned):
-            if term == node.data:
-                self.found_nodes.append(node)
-                self.pinned.pop(index)
+        if node.key not in self.pinned_keys:
+            return
+
+        self.found_nodes.append(node)
+        self.pinned_keys.discard(node.key)
+        self.pinned = [term for term in self.pinned if make_key(term) != node.key]
+
+        if not self.pinned_keys:
+            raise _FoundGoal
 
     def _process_current(self):
         for node in self.current_nodes:
             node.propagate()
-            self._check_pinned(node)
         
         self.current_nodes = self.next_nodes
-        self.next_nodes = []
+        self.next_nodes = deque()
     
-    def process(self):
-        while self.current_nodes and self.pinned:
+    def _meet(self, visited: Dict[int, Node]) -> Optional[Meeting]:
+        """ Finds the current node also present in visited (of the search
+        running from the other end) with the shortest way back there """
+
+        meeting: Optional[Meeting] = None
+
+        for node in self.current_nodes:
+            other = visited.get(node.key)
+            if other is not None and (meeting is None or other.depth < meeting[1].depth):
+                meeting = (node, other)
+
+        return meeting
+
+    def _splice(self, node: Node, other: Node) -> Node:
+        """ Extends node with the moves leading from other to its start,
+        other being the same state found by the search from the goal.
+        The new nodes are not added to visited """
+
+        while other.parent is not None and other.parent_delta is not None:
+            init, final = other.parent_delta
+            other = other.parent
+            new = Node._from_masks(other.masks[:], other.key, self)
+            new.parent = node
+            new.parent_delta = (final, init)
+            new.depth = node.depth + 1
+            node = new
+
+        return node
+
+    def _search_bidirectional(self):
+        goal = Graph(self.pinned[0], self.rings)
+        meeting = self._meet(goal.visited)
+
+        while not meeting and self.current_nodes and goal.current_nodes:
+            if len(self.current_nodes) <= len(goal.current_nodes):
+                self._process_current()
+                meeting = self._meet(goal.visited)
+            else:
+                goal._process_current()
+                found = goal._meet(self.visited)
+                if found:
+                    meeting = (found[1], found[0])
+
+        if meeting:
+            self._check_pinned(self._splice(*meeting))
+
+    def _search(self):
+        if len(self.pinned_keys) == 1:
+            self._search_bidirectional()
+            return
+
+        while self.current_nodes and self.pinned_keys:
             self._process_current()
+
+    def process(self):
+        self.pinned_keys = {make_key(term) for term in self.pinned}
+
+        try:
+            for node in self.current_nodes:
+                self._check_pinned(node)
+
+            self._search()
+
+        except _FoundGoal:
+            return
     
     def __repr__(self):
         return repr({
@@ -54,37 +221,33 @@ class Graph():
             "current_nodes": self.current_nodes,
             "next_nodes": self.next_nodes
         })
-class NodeStage(Enum):
-    CURRENT = auto()
-    NEXT = auto()
-    PROTOTYPE = auto()
-
 class NodePrototype():
+    __slots__ = ("masks", "key")
 
-    def __init__(self, data: TowerSet):
-        self.data = deepcopy(data)
-        if not self.check_validity():
+    def __init__(self, data: TowerSet, validate: bool = True):
+        if validate and not check_validity(data):
             raise InvalidRingOrderError
 
-    def check_validity(self):
-        for tower in self.data:
-            sorted_tower = deepcopy(tower)
-            sorted_tower.sort()
-            sorted_tower.reverse()
+        self.masks = make_masks(data)
+        self.key = make_key(data)
 
-            if sorted_tower != tower:
-                return False
-        
-        return True
+    @property
+    def data(self) -> TowerSet:
+        return [
+            [ring for ring in range(mask.bit_length(), 0, -1) if mask >> (ring - 1) & 1]
+            for mask in self.masks
+        ]
 
     def _is_patch_valid(self, delta: Delta):
         init, final = delta
+        top_init = self.masks[init] & -self.masks[init]
+        top_final = self.masks[final] & -self.masks[final]
         status = False
         
-        if len(self.data[init]) > 0:
-            if len(self.data[final]) == 0:
+        if top_init:
+            if not top_final:
                 status = True
-            elif self.data[final][-1] > self.data[init][-1]:
+            elif top_final > top_init:
                 status = True
         
         return status
@@ -92,100 +255,104 @@ class NodePrototype():
     def __repr__(self):
         return repr(self.data)
 
-    def patch(self, delta: Delta):
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        if not isinstance(other, NodePrototype):
+            return NotImplemented
+        return self.key == other.key
+
+    def _move(self, delta: Delta):
         init, final = delta
 
+        top = self.masks[init] & -self.masks[init]
+        self.masks[init] ^= top
+        self.masks[final] |= top
+        shift = digit_bits(len(self.masks)) * (top.bit_length() - 1)
+        self.key = self.key + ((final - init) << shift)
+
+    def patch(self, delta: Delta):
         if self._is_patch_valid(delta):
-            self.data[final].append(self.data[init].pop())
+            self._move(delta)
         else:
             raise InvalidRingOrderError
 
-def pop_list(index_list: List[int], item_list: List[Any]):
-    index_list.sort()
-    index_list.reverse()
-
-    for i in index_list:
-        item_list.pop(i)
-
 class Node(NodePrototype):
     """ Node Class """
+    __slots__ = ("graph", "mods", "parent", "parent_delta", "depth")
+
+    def __init__(self, data: TowerSet, graph: Graph, validate: bool = True):
+        super().__init__(data, validate)
+        self._setup(graph)
+        graph.visited[self.key] = self
+
+    @classmethod
+    def _from_masks(cls, masks: List[int], key: int, graph: Graph) -> Node:
+        """ Builds straight from ring masks and their key, skipping the
+        tower set round trip """
 
+        node = cls.__new__(cls)
+        node.masks = masks
+        node.key = key
+        node._setup(graph)
+        return node
 
-    def __init__(self, data: TowerSet, graph: Graph):
-        super().__init__(data)
+    def _setup(self, graph: Graph):
         self.graph = graph
-        self.connections: List[Node] = []
         self.mods: Optional[ModList] = None
-        self.history: List[History] = []
+        self.parent: Optional[Node] = None
+        self.parent_delta: Optional[Delta] = None
+        self.depth = 0
 
     def _generate(self):
         self.mods = ModList(self)
         self.mods.generate()
-        self.mods.filter_out([node.data for node in self.connections])
-    
-    def _copy_history(self, node: Node):
-        for log in node.history:
-            node, history = log
-            new = (node, copy(history))
-            self.history.append(new)
-    
-    def add_history(self, connection: Connection):
-        node, delta = connection
-        self._copy_history(node)
-        for _, log in self.history:
-            log.append(delta)
-        self.history.append((node, [delta]))
-        
-    def _connect_existing(self, nodes: List[Node], stage: NodeStage):
-        tsl = [node.data for node in nodes] 
-        rml = []
-
-        if not self.mods:
-            return
-        
-        for i,j in self.mods._get_mod_list(tsl):
-            tower_set, delta = self.mods.data[j]
-            nodes[i]._connect((self, delta), stage)
-            rml.append(j)
     
-        pop_list(rml, self.mods.data)
-        
-    def _connect(self, connection: Connection, stage: NodeStage):
-        node, delta = connection
-        
-        self.connections.append(node)
-        node.connections.append(self)
-        
-        if stage != NodeStage.CURRENT:
-            self.add_history(connection)
-        if stage == NodeStage.PROTOTYPE:
+    def _connect(self, node: Node, delta: Delta):
+        if self.parent is None:
+            self.parent = node
+            self.parent_delta = delta
+            self.depth = node.depth + 1
             self.graph.next_nodes.append(self)
     
     def __repr__(self):
         return repr({
             "data": self.data,
-            "connections": [node.data for node in self.connections],
+            "parent": self.parent.data if self.parent else None,
             "mods": self.mods,
         })
 
     def propagate(self):
         self._generate()
-        self._connect_existing(self.graph.current_nodes, NodeStage.CURRENT)
-        # self._connect_existing(self.graph.next_nodes, NodeStage.NEXT)
         
         if not self.mods:
             return None
         
-        self.mods.filter_out([node.data for node in self.graph.next_nodes])
-
-        nodes = [Node(ts, self.graph) for ts, _ in self.mods.data]
-        for i, node in enumerate(nodes):
-            _, delta = self.mods.data[i]
-            node._connect((self, delta), NodeStage.PROTOTYPE)
-        
+        self.adopt(self.mods.data)
         self.mods.data = []
 
+    def adopt(self, children: List[ConnectionPrototype]):
+        """ Links the states from expand into the graph """
+
+        graph = self.graph
+        visited = graph.visited
+        pinned_keys = graph.pinned_keys
+        masks = self.masks
+        from_masks = Node._from_masks
+
+        for key, delta in children:
+            if key in visited:
+                continue
+
+            node = from_masks(move_masks(masks, delta), key, graph)
+            visited[key] = node
+            node._connect(self, delta)
+            if key in pinned_keys:
+                graph._check_pinned(node)
+
 class ModList():
+    __slots__ = ("data", "node")
 
     def __init__(self, node: Node):
         self.data: List[ConnectionPrototype] = []
@@ -194,40 +361,11 @@ class ModList():
     def generate(self):
         """ Generates mods of the self """
 
-        for init, final in permutations(range(len(self.node.data)),2):
-            
-            try:
-                mod = NodePrototype(self.node.data)
-                mod.patch((init, final))
-
-            except InvalidRingOrderError:
-                continue
-
-            else:
-                self.data.append((mod.data, (init, final)))
+        node = self.node
+        self.data.extend(node.graph._expand(node.masks, node.key))
     
     def __iter__(self):
         return iter(self.data)
     
     def __repr__(self):
-        return repr([{"tower_set": t, "delta": d} for t, d in self.data])
-    
-    def _get_mod_list(self, tower_sets: List[TowerSet]):
-        """ Gets index of item in list matching the arg 
-        i: matching index of arg
-        j: matching index from self.data
-        """
-
-        result: List[Tuple[int,int]] = []
-
-        for i, term in enumerate(tower_sets):
-            for j, mod in enumerate(self.data):
-                tower_set, _ = mod
-                if term == tower_set:
-                    result.append((i,j))
-        
-        return result
-
-    def filter_out(self, tower_sets: List[TowerSet]):
-        rml = [index for _, index in self._get_mod_list(tower_sets)]
-        pop_list(rml, self.data)
+        return repr([{"key": k, "delta": d} for k, d in self.data])
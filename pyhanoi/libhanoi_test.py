@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING
 from copy import deepcopy
 
 from pyhanoi import libhanoi
+from pyhanoi.__main__ import trace_log
 
 if TYPE_CHECKING:
     from libhanoi import TowerSet
@@ -19,6 +20,44 @@ class TestGraph(unittest.TestCase):
     def test_init(self):
         self.assertEqual(self.graph.current_nodes[0].data, self.node_data)
 
+class TestProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.start: TowerSet = [[3,2,1],[],[]]
+        self.goal: TowerSet = [[],[],[3,2,1]]
+        self.graph = libhanoi.Graph(self.start, 3)
+        self.graph.pinned.append(self.goal)
+
+    def test_process(self):
+        self.graph.process()
+        node = self.graph.found_nodes[0]
+        self.assertEqual(node.data, self.goal)
+        self.assertEqual(node.depth, 7)
+
+        while node.parent is not None:
+            node = node.parent
+        self.assertEqual(node.data, self.start)
+
+    def test_process_pinned(self):
+        graph = libhanoi.Graph(self.start, 3)
+        graph.pinned += [[[3],[1],[2]], [[3,2],[1],[]]]
+        graph.process()
+
+        found = sorted((node.depth, node.data) for node in graph.found_nodes)
+        self.assertEqual(found, [(1, [[3,2],[1],[]]), (2, [[3],[1],[2]])])
+        self.assertEqual(graph.pinned, [])
+        self.assertEqual(graph.pinned_keys, set())
+        self.assertEqual(max(node.depth for node in graph.visited.values()), 2)
+
+    def test_splice_keeps_visited(self):
+        self.graph.process()
+        node = self.graph.found_nodes[0]
+        self.assertNotIn(node.key, self.graph.visited)
+
+        for key, visited in self.graph.visited.items():
+            self.assertEqual(visited.key, key)
+            self.assertEqual(visited.depth, len(trace_log(visited)))
+
 class TestNodePrototype(unittest.TestCase):
 
     def setUp(self):
@@ -31,11 +70,29 @@ class TestNodePrototype(unittest.TestCase):
         new = deepcopy(self.node_prototype)
         new.patch(delta)
         self.assertEqual(new.data, expected_data)
+        self.assertEqual(new.key, libhanoi.make_key(expected_data))
     
+    def test_hash(self):
+        same = libhanoi.NodePrototype([[4,3,2,1],[],[]])
+        other = libhanoi.NodePrototype([[4,3,2],[1],[]])
+        self.assertEqual(self.node_prototype, same)
+        self.assertIn(same, {self.node_prototype})
+        self.assertNotIn(other, {self.node_prototype})
+
     def test_check_validity(self):
-        self.assertTrue(self.node_prototype.check_validity())
-        false_np = libhanoi.NodePrototype([[4,3,1,2],[],[]])
-        self.assertFalse(false_np.check_validity())
+        self.assertTrue(libhanoi.check_validity(self.node_data))
+        self.assertFalse(libhanoi.check_validity([[4,3,1,2],[],[]]))
+        with self.assertRaises(libhanoi.InvalidRingOrderError):
+            libhanoi.NodePrototype([[4,3,1,2],[],[]])
+
+class TestMakeExpand(unittest.TestCase):
+
+    def test_matches_expand(self):
+        node_data: TowerSet = [[4,1],[3],[],[2]]
+        masks = libhanoi.make_masks(node_data)
+        key = libhanoi.make_key(node_data)
+        specialized = libhanoi.make_expand(len(node_data))
+        self.assertEqual(specialized(masks, key), libhanoi.expand(masks, key))
 
 class TestNode(unittest.TestCase):
     